@@ -0,0 +1,124 @@
+"""Persistent on-disk cache of per-column statistics.
+
+Entries are ``.npz`` archives of NumPy arrays stored under
+``<cache_dir>/v<CACHE_VERSION>/<source fingerprint>/``. The fingerprint covers
+the source path, size, mtime and a hash of the parquet footer, so editing the
+source simply stops matching the old entries, which then age out through
+size-bounded LRU eviction. Bumping ``CACHE_VERSION`` orphans every old entry.
+"""
+
+import hashlib
+import os
+import struct
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+PARQUET_MAGIC = b"PAR1"
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "chartdrive"
+
+
+def fingerprint(path) -> str:
+    """Identify a source file by path, size, mtime and parquet footer."""
+    stat = os.stat(path)
+    digest = hashlib.sha1(
+        f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    )
+    with open(path, "rb") as f:
+        if stat.st_size >= 12:
+            f.seek(-8, os.SEEK_END)
+            footer_length, magic = struct.unpack("<I4s", f.read(8))
+            if magic == PARQUET_MAGIC and footer_length <= stat.st_size - 12:
+                f.seek(-8 - footer_length, os.SEEK_END)
+                digest.update(f.read(footer_length))
+    return digest.hexdigest()
+
+
+class AggregateCache:
+    def __init__(self, cache_dir=None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or default_cache_dir())
+        self.max_bytes = max_bytes
+
+    def for_source(self, path) -> "SourceCache":
+        return SourceCache(self, fingerprint(path))
+
+    def path(self, source: str, columns, name: str) -> Path:
+        columns_id = hashlib.sha1("\0".join(columns).encode()).hexdigest()[:16]
+        return (
+            self.cache_dir / f"v{CACHE_VERSION}" / source / f"{name}-{columns_id}.npz"
+        )
+
+    def load(self, source: str, columns, name: str):
+        """Return the cached arrays as a dict, or ``None`` on a miss."""
+        path = self.path(source, columns, name)
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                arrays = {key: archive[key] for key in archive.files}
+        except FileNotFoundError:
+            return None
+        except (EOFError, OSError, ValueError, zipfile.BadZipFile):
+            path.unlink(missing_ok=True)
+            return None
+        # Refresh the mtime so eviction treats it as recently used.
+        os.utime(path)
+        return arrays
+
+    def save(self, source: str, columns, name: str, arrays: dict):
+        path = self.path(source, columns, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.evict()
+
+    def evict(self):
+        """Drop other cache versions, then least recently used entries over budget."""
+        if not self.cache_dir.is_dir():
+            return
+        current = f"v{CACHE_VERSION}"
+        entries = []
+        for version_dir in self.cache_dir.iterdir():
+            if version_dir.name != current:
+                for path in version_dir.rglob("*"):
+                    if path.is_file():
+                        path.unlink(missing_ok=True)
+                continue
+            for path in version_dir.rglob("*.npz"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class SourceCache:
+    """An ``AggregateCache`` bound to the fingerprint of one source file."""
+
+    def __init__(self, cache: AggregateCache, source: str):
+        self.cache = cache
+        self.source = source
+
+    def load_or_compute(self, columns, name: str, compute) -> dict:
+        arrays = self.cache.load(self.source, columns, name)
+        if arrays is None:
+            arrays = compute()
+            self.cache.save(self.source, columns, name, arrays)
+        return arrays
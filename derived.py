@@ -0,0 +1,94 @@
+"""Derived series evaluated lazily over the visible rows.
+
+A ``Derived`` wraps a polars expression such as a rolling mean, a diff or the
+ratio of two columns. Instead of materialising the expression over the whole
+frame, it is evaluated over the requested row range plus ``warmup`` leading
+rows, which is what window functions need to produce the same values they would
+over the full frame. The last evaluated range is cached, and panning only
+evaluates the rows that were not already covered.
+
+Only row-local look-back is supported with a ``warmup``: each row may depend
+on itself and at most ``warmup`` preceding rows, as with ``rolling_*``,
+``diff``, ``shift`` by a positive count, ``pct_change`` or element-wise
+arithmetic. Expressions that aggregate the column (``mean``, ``max``), look
+ahead (``shift(-1)``) or carry state from the first row (``cum_*``, ``ewm_*``,
+``cumulative_eval``) give different values over a window; leave ``warmup``
+unset for those, and the expression is evaluated once over the whole frame.
+"""
+
+import hashlib
+import threading
+
+import polars as pl
+
+
+class Derived:
+    def __init__(self, expr: pl.Expr, warmup: int = None, name: str = None):
+        """``warmup`` is the number of preceding rows the expression looks back
+        over, e.g. ``n - 1`` for ``rolling_mean(n)``, ``1`` for ``diff()`` and
+        ``0`` for element-wise expressions such as ratios. ``None`` evaluates
+        the whole frame, which is always correct."""
+        if warmup is not None and warmup < 0:
+            raise ValueError(f"warmup must be at least 0, got {warmup}")
+        self.expr = expr
+        self.warmup = warmup
+        self.name = name or expr.meta.output_name()
+        self._df = None
+        self._start = 0
+        self._values = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Derived({self.expr}, warmup={self.warmup})"
+
+    def key(self) -> str:
+        """Identify the computation, including the arguments ``repr`` leaves out."""
+        digest = hashlib.sha1(self.expr.meta.serialize()).hexdigest()
+        return f"{self.name}:{digest}"
+
+    def _compute(self, df: pl.DataFrame, start: int, stop: int) -> pl.Series:
+        lo = max(start - self.warmup, 0)
+        values = df.slice(lo, stop - lo).select(self.expr.alias(self.name))
+        return values.to_series().slice(start - lo, stop - start)
+
+    def evaluate(self, df: pl.DataFrame, start: int, stop: int) -> pl.Series:
+        """Return the series for rows ``[start, stop)`` of ``df``."""
+        with self._lock:
+            if self.warmup is None:
+                if self._values is None or df is not self._df:
+                    self._df = df
+                    self._start = 0
+                    self._values = df.select(self.expr.alias(self.name)).to_series()
+                return self._values.slice(start, stop - start)
+
+            cached_stop = self._start + (
+                len(self._values) if self._values is not None else 0
+            )
+            if (
+                self._values is None
+                or df is not self._df
+                or stop < self._start
+                or start > cached_stop
+            ):
+                self._df = df
+                self._start = start
+                self._values = self._compute(df, start, stop)
+            else:
+                parts = [self._values]
+                if start < self._start:
+                    parts.insert(0, self._compute(df, start, self._start))
+                    self._start = start
+                if stop > cached_stop:
+                    parts.append(self._compute(df, cached_stop, stop))
+                self._values = pl.concat(parts) if len(parts) > 1 else self._values
+
+            # Keep one window of slack on each side for panning back and forth.
+            keep_start = max(start - (stop - start), self._start)
+            keep_stop = stop + (stop - start)
+            if keep_start > self._start or self._start + len(self._values) > keep_stop:
+                self._values = self._values.slice(
+                    keep_start - self._start, keep_stop - keep_start
+                )
+                self._start = keep_start
+
+            return self._values.slice(start - self._start, stop - start)
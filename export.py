@@ -0,0 +1,109 @@
+"""Export a plot's current view to a self-contained interactive plotly HTML file.
+
+Every series is decimated to the minimum and maximum sample of each pixel
+column, which keeps spikes visible while bounding the number of points by the
+target width instead of the source row count. A few zoom levels are embedded,
+each at twice the resolution of the previous one, and a small script swaps
+levels as the browser view is zoomed.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+import polars as pl
+
+LEVEL_SCRIPT = """
+const gd = document.getElementById("{plot_id}");
+const levels = %(levels)d, perLevel = %(per_level)d;
+const position = (v) =>
+  gd.layout.xaxis.type === "date"
+    ? new Date(String(v).replace(" ", "T") + "Z").getTime()
+    : Number(v);
+const span = (range) => position(range[1]) - position(range[0]);
+const fullSpan = span(gd.layout.xaxis.range);
+let current = 0;
+gd.on("plotly_relayout", () => {
+  const zoom = fullSpan / span(gd.layout.xaxis.range);
+  if (!Number.isFinite(zoom) || zoom <= 0) return;
+  const level = Math.min(levels - 1, Math.max(0, Math.ceil(Math.log2(zoom) - 1e-9)));
+  if (level === current) return;
+  current = level;
+  const visible = [];
+  for (let i = 0; i < levels * perLevel; i++) visible.push(Math.floor(i / perLevel) === level);
+  Plotly.restyle(gd, {visible: visible});
+});
+"""
+
+
+def decimate(df: pl.DataFrame, x_axis: str, column: str, left, right, buckets: int):
+    """Reduce ``column`` to its min and max sample per bucket, in x order."""
+    bucket = (
+        ((pl.col(x_axis) - left) / (right - left) * buckets)
+        .floor()
+        .clip(0, buckets - 1)
+        .cast(pl.Int64)
+    )
+    agg = (
+        df.select([x_axis, column])
+        .drop_nulls()
+        .with_columns(bucket.alias("_bucket"))
+        .group_by("_bucket")
+        .agg(
+            pl.col(x_axis).get(pl.col(column).arg_min()).alias("_x_min"),
+            pl.col(x_axis).get(pl.col(column).arg_max()).alias("_x_max"),
+            pl.col(column).min().alias("_y_min"),
+            pl.col(column).max().alias("_y_max"),
+        )
+        .sort("_bucket")
+    )
+    xs = np.array(agg.select(["_x_min", "_x_max"]).to_numpy())
+    ys = np.array(agg.select(["_y_min", "_y_max"]).to_numpy())
+    swap = xs[:, 0] > xs[:, 1]
+    xs[swap] = xs[swap, ::-1]
+    ys[swap] = ys[swap, ::-1]
+    return xs.ravel(), ys.ravel()
+
+
+def export_html(plot, path, width: int = 2000, levels: int = 3):
+    """Write the visible part of ``plot`` to ``path``.
+
+    The file holds fewer than ``2 * width * 2**levels`` points per series."""
+    theme = plot.active_theme()
+    view = plot.view_box
+    df = plot.visible_frame()
+
+    fig = go.Figure()
+    for level in range(levels):
+        for i, col in enumerate(plot.y_columns):
+            xs, ys = decimate(
+                df, plot.x_axis, col, view.left, view.right, width << level
+            )
+            if np.issubdtype(xs.dtype, np.integer):
+                # The viewer treats integer x values as unix microseconds.
+                xs = xs.astype("datetime64[us]")
+            fig.add_trace(
+                go.Scattergl(
+                    x=xs,
+                    y=ys,
+                    name=col,
+                    mode="lines",
+                    line=dict(color=theme.accents[i].hex()),
+                    visible=level == 0,
+                )
+            )
+
+    x_range = [view.left, view.right]
+    if df[plot.x_axis].dtype.is_integer():
+        x_range = np.array(x_range, dtype=np.int64).astype("datetime64[us]").tolist()
+    fig.update_layout(
+        paper_bgcolor=theme.bg0.hex(),
+        plot_bgcolor=theme.bg1.hex(),
+        font=dict(color=theme.fg0.hex()),
+        xaxis=dict(range=x_range, gridcolor=theme.fg1.hex()),
+        yaxis=dict(range=[view.bottom, view.top], gridcolor=theme.fg1.hex()),
+    )
+    fig.write_html(
+        path,
+        include_plotlyjs=True,
+        post_script=LEVEL_SCRIPT
+        % {"levels": levels, "per_level": len(plot.y_columns)},
+    )
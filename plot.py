@@ -2,9 +2,11 @@ import pygame
 import polars as pl
 import time
 from dataclasses import dataclass
+from functools import lru_cache
 import numpy as np
 from theme import onehalfdark, themes
 from widgits import Widget, Window, Block, Paragraph, List
+from derived import Derived
 
 
 def theme_generator():
@@ -78,35 +80,200 @@ def compute_grid_lines(view_box: ViewBox):
     return x_lines[1:], y_lines[1:]
 
 
+DENSITY_CHUNK = 1 << 18
+
+
+def segment_runs(x0, y0, x1, y1, width):
+    """Split segments into vertical pixel runs, one per pixel column they cross.
+
+    Returns the segment index, column, top row and bottom row of every run.
+    Columns outside ``[0, width)`` are skipped."""
+    flip = x0 > x1
+    x0, x1 = np.where(flip, x1, x0), np.where(flip, x0, x1)
+    y0, y1 = np.where(flip, y1, y0), np.where(flip, y0, y1)
+    first = np.maximum(np.floor(x0), 0).astype(np.int64)
+    last = np.minimum(np.floor(x1), width - 1).astype(np.int64)
+    runs = np.maximum(last - first + 1, 0)
+
+    segment = np.repeat(np.arange(len(runs)), runs)
+    offsets = np.repeat(np.cumsum(runs) - runs, runs)
+    column = first[segment] + np.arange(len(segment)) - offsets
+
+    # The y values where the segment enters and leaves each column.
+    dx = (x1 - x0)[segment]
+    slope = np.divide((y1 - y0)[segment], dx, out=np.zeros_like(dx), where=dx > 0)
+    start, stop = x0[segment], x1[segment]
+    ya = y0[segment] + (np.maximum(start, column) - start) * slope
+    yb = np.where(
+        dx > 0,
+        y0[segment] + (np.minimum(stop, column + 1) - start) * slope,
+        y1[segment],
+    )
+    top = np.floor(np.minimum(ya, yb)).astype(np.int64)
+    bottom = np.floor(np.maximum(ya, yb)).astype(np.int64)
+    return segment, column, top, bottom
+
+
+def density_counts(x, ys, width, height, segments=True, chunk=DENSITY_CHUNK):
+    """Per-pixel density, indexed ``[x, y]`` like ``pygame.surfarray``.
+
+    ``x`` holds the pixel x coordinates shared by every series and ``ys`` yields
+    the pixel y coordinates of one series at a time. Without ``segments`` every
+    sample adds one to its pixel. With ``segments`` every line segment between
+    consecutive samples adds a total of one, spread evenly over the pixels it
+    passes through, so dense data counts like its samples while sparse lines
+    stay connected. Series are processed ``chunk`` samples at a time."""
+    if not segments:
+        counts = np.zeros(width * height, dtype=np.int64)
+        for y in ys:
+            for start in range(0, len(y), chunk):
+                px = np.floor(x[start : start + chunk])
+                py = np.floor(y[start : start + chunk])
+                inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+                index = (px[inside] * height + py[inside]).astype(np.int64)
+                counts += np.bincount(index, minlength=width * height)
+        return counts.reshape(width, height)
+
+    # Each run adds its weight at its top row and removes it below its bottom
+    # row; a cumulative sum down every column then turns the edges into counts.
+    edges = np.zeros(width * (height + 1))
+    for y in ys:
+        # Chunks overlap by one sample so the segment joining them is kept.
+        for start in range(0, max(len(y) - 1, 1), chunk):
+            stop = min(start + chunk + 1, len(y))
+            x0, x1 = x[start : stop - 1], x[start + 1 : stop]
+            y0, y1 = y[start : stop - 1], y[start + 1 : stop]
+            finite = np.isfinite(y0) & np.isfinite(y1)
+            segment, column, top, bottom = segment_runs(
+                x0[finite], y0[finite], x1[finite], y1[finite], width
+            )
+            length = bottom - top + 1
+            weight = 1 / np.bincount(segment, weights=length)[segment]
+
+            visible = (bottom >= 0) & (top < height)
+            base = column[visible] * (height + 1)
+            weight = weight[visible]
+            index = np.concatenate(
+                [
+                    base + np.clip(top[visible], 0, height - 1),
+                    base + np.clip(bottom[visible], 0, height - 1) + 1,
+                ]
+            )
+            edges += np.bincount(
+                index,
+                weights=np.concatenate([weight, -weight]),
+                minlength=len(edges),
+            )
+    counts = np.cumsum(edges.reshape(width, height + 1), axis=1)[:, :height]
+    # Drop the rounding residue the cumulative sum leaves in empty pixels.
+    counts[counts < 1e-9] = 0
+    return counts
+
+
+@lru_cache
+def density_colormap(theme, size=256):
+    """Lookup table of ``size`` RGB rows rising from the plot background."""
+    stops = [theme.bg1, theme.blue, theme.cyan, theme.yellow, theme.fg0]
+    rgb = np.array([stop.rgb() for stop in stops], dtype=np.float64)
+    positions = np.linspace(0, 1, len(stops))
+    samples = np.linspace(0, 1, size)
+    return np.stack(
+        [np.interp(samples, positions, rgb[:, channel]) for channel in range(3)],
+        axis=1,
+    ).astype(np.uint8)
+
+
 class LinePlot(Widget):
     def __init__(
-        self, df: pl.DataFrame, x_axis="time", y_columns=None, grid=True, legend=True
+        self,
+        df: pl.DataFrame,
+        x_axis="time",
+        y_columns=None,
+        grid=True,
+        legend=True,
+        density=False,
+        density_segments=True,
+        cache=None,
     ):
+        """``y_columns`` may mix column names, polars expressions and ``Derived``
+        series. Bare expressions are evaluated over the whole frame; wrap them in
+        ``Derived`` with a ``warmup`` to evaluate only the visible rows.
+
+        ``cache`` is an optional ``cache.SourceCache`` for the source of ``df``,
+        used to reuse the column statistics across launches."""
         self.df = df
         self.x_axis = x_axis
-        self.y_columns = y_columns or list(set(df.columns) - {x_axis})
+        self.y_columns = []
+        self.raw_columns = []
+        self.derived = {}
+        for col in y_columns or [col for col in df.columns if col != x_axis]:
+            if isinstance(col, pl.Expr):
+                col = Derived(col)
+            name = col.name if isinstance(col, Derived) else col
+            if name in self.y_columns:
+                raise ValueError(
+                    f"duplicate series {name!r}; alias derived expressions"
+                )
+            if isinstance(col, Derived):
+                self.derived[name] = col
+            else:
+                self.raw_columns.append(col)
+            self.y_columns.append(name)
         self.grid = grid
         self.legend = legend
+        self.density = density
+        self.density_segments = density_segments
         self.font = pygame.font.SysFont("firacodenerdfont", 10)
+        self.theme = None
 
+        if cache is not None:
+            stats = cache.load_or_compute(
+                [self.x_axis, *self.series_key()], "stats", self.compute_stats
+            )
+        else:
+            stats = self.compute_stats()
+        self.x_sorted = bool(stats["x_sorted"])
         self.view_box = ViewBox(
-            df[self.x_axis].min(),
-            df[self.x_axis].max(),
-            df.select([pl.col(col) for col in self.y_columns])
-            .min()
-            .min_horizontal()
-            .item(),
-            df.select([pl.col(col) for col in self.y_columns])
-            .max()
-            .max_horizontal()
-            .item(),
+            stats["x_extent"][0].item(),
+            stats["x_extent"][1].item(),
+            float(np.nanmin(stats["y_min"])),
+            float(np.nanmax(stats["y_max"])),
         )
         self._block = None
 
+    def series_key(self):
+        """Identify the plotted series, including how derived ones are computed."""
+        return [
+            self.derived[col].key() if col in self.derived else col
+            for col in self.y_columns
+        ]
+
+    def compute_stats(self):
+        """Extents of the plotted series and sortedness of the x axis."""
+        x = self.df[self.x_axis]
+        series = self.df.select(
+            [pl.col(col) for col in self.raw_columns]
+            + [d.expr.alias(name) for name, d in self.derived.items()]
+        ).cast(pl.Float64)
+        return {
+            "x_extent": np.array([x.min(), x.max()]),
+            "x_sorted": np.array(x.is_sorted()),
+            "y_min": series.min().to_numpy().ravel(),
+            "y_max": series.max().to_numpy().ravel(),
+        }
+
     def with_view(self, view_box: ViewBox):
         self.view_box = view_box
         return self
 
+    def with_theme(self, theme):
+        self.theme = theme
+        return self
+
+    def active_theme(self):
+        """Return the plot's own theme, falling back to the global one."""
+        return self.theme if self.theme is not None else theme
+
     def lerp(self, x0, x1, y0, y1, x):
         return (x - x0) / (x1 - x0) * (y1 - y0) + y0
 
@@ -122,11 +289,66 @@ class LinePlot(Widget):
             return y.cast(pl.Int32)
         return int(y)
 
-    def map_to_pixel(self, width, height):
-        df = self.df.filter(
-            pl.col(self.x_axis).is_between(self.view_box.left, self.view_box.right)
+    def visible_rows(self, pad=0):
+        """Row range ``[start, stop)`` inside the view box, widened by ``pad`` rows
+        on each side; needs a sorted x axis."""
+        x = self.df[self.x_axis].to_numpy()
+        start = int(np.searchsorted(x, self.view_box.left, side="left"))
+        stop = int(np.searchsorted(x, self.view_box.right, side="right"))
+        return max(start - pad, 0), min(stop + pad, len(x))
+
+    def visible_frame(self, pad=0):
+        """The x axis and every y series, restricted to rows inside the view box.
+
+        Derived series are only evaluated over the visible rows. ``pad`` keeps
+        that many rows beyond each edge of a sorted x axis."""
+        if not self.x_sorted:
+            df = self.df.select([self.x_axis, *self.raw_columns]).with_columns(
+                [d.evaluate(self.df, 0, self.df.height) for d in self.derived.values()]
+            )
+            return df.filter(
+                pl.col(self.x_axis).is_between(self.view_box.left, self.view_box.right)
+            )
+
+        start, stop = self.visible_rows(pad)
+        df = self.df.slice(start, stop - start).select(
+            [self.x_axis, *self.raw_columns]
+        )
+        return df.with_columns(
+            [d.evaluate(self.df, start, stop) for d in self.derived.values()]
         )
 
+    def interpolate_row(self, df: pl.DataFrame, outside, inside, x):
+        """A one-row frame on the segment between two rows, at position ``x``."""
+        ends = df[[outside, inside]].cast(pl.Float64).to_numpy()
+        t = (x - ends[0, 0]) / (ends[1, 0] - ends[0, 0])
+        row = pl.DataFrame(
+            [ends[0] + t * (ends[1] - ends[0])], schema=df.columns, orient="row"
+        )
+        return row.fill_nan(None).cast(df.schema)
+
+    def clip_to_view(self, df: pl.DataFrame):
+        """Move end rows lying outside the view box onto its left and right edges."""
+        if df.height < 2:
+            return df
+        if df[self.x_axis][0] < self.view_box.left:
+            df = pl.concat(
+                [self.interpolate_row(df, 0, 1, self.view_box.left), df.slice(1)]
+            )
+        last = df.height - 1
+        if df[self.x_axis][last] > self.view_box.right:
+            df = pl.concat(
+                [
+                    df.slice(0, last),
+                    self.interpolate_row(df, last, last - 1, self.view_box.right),
+                ]
+            )
+        return df
+
+    def map_to_pixel(self, width, height):
+        # One row beyond each edge keeps the segments crossing the edges.
+        df = self.clip_to_view(self.visible_frame(pad=1))
+
         df = df.with_columns(
             (self.map_x_to_pixel(pl.col(self.x_axis), width)).alias(self.x_axis)
         )
@@ -140,6 +362,7 @@ class LinePlot(Widget):
         return df
 
     def render_legend(self, surface: pygame.Surface):
+        theme = self.active_theme()
         rect = surface.get_rect()
         for i, col in enumerate(self.y_columns):
             left = rect.right - 50
@@ -152,7 +375,63 @@ class LinePlot(Widget):
         self._block = block
         return self
 
+    def render_density(self, surface: pygame.Surface):
+        """Shade every pixel by how many samples, or line segments, fall in it."""
+        width, height = surface.get_size()
+        df = self.visible_frame(pad=1)
+        if df.height == 0:
+            return
+        if not self.x_sorted:
+            df = df.sort(self.x_axis)
+        df = self.clip_to_view(df)
+        x = self.lerp(
+            self.view_box.left,
+            self.view_box.right,
+            0,
+            width,
+            df[self.x_axis].cast(pl.Float64).to_numpy(),
+        )
+        ys = (
+            self.lerp(
+                self.view_box.top,
+                self.view_box.bottom,
+                0,
+                height,
+                df[col].cast(pl.Float64).to_numpy(),
+            )
+            for col in self.y_columns
+        )
+        counts = density_counts(x, ys, width, height, self.density_segments)
+        hit = counts > 0
+        if not hit.any():
+            return
+
+        colormap = density_colormap(self.active_theme())
+        scaled = np.log1p(counts[hit]) / np.log1p(counts.max())
+        pixels = pygame.surfarray.pixels3d(surface)
+        # Index 0 is the background, so every hit pixel stays visible.
+        index = np.maximum((scaled * (len(colormap) - 1)).astype(np.intp), 1)
+        pixels[hit] = colormap[index]
+        del pixels
+
+    def render_series(self, surface: pygame.Surface):
+        """Draw only the data, filling the whole surface."""
+        if self.density:
+            self.render_density(surface)
+            return
+
+        theme = self.active_theme()
+        pixel_df = self.map_to_pixel(*surface.get_size())
+
+        for i, col in enumerate(self.y_columns):
+            color = theme.accents[i]
+            data = pixel_df.select([self.x_axis, col]).drop_nulls().to_numpy()
+            if len(data) < 2:
+                continue
+            pygame.draw.aalines(surface, color.rgb(), False, data)
+
     def render(self, area: pygame.Rect, surface: pygame.Surface):
+        theme = self.active_theme()
         width, height = area.width, area.height
         margin = 50
         pygame.draw.rect(surface, theme.bg0.rgb(), area)
@@ -197,43 +476,25 @@ class LinePlot(Widget):
                 pos = (margin - text_width_px, margin + y_pixel)
                 surface.blit(text_surface, pos)
 
-        pixel_df = self.map_to_pixel(*inner_surface.get_size())
-
-        for i, col in enumerate(self.y_columns):
-            color = theme.accents[i]
-            data = pixel_df.select([self.x_axis, col]).to_numpy()
-            if len(data) < 2:
-                continue
-            pygame.draw.aalines(inner_surface, color.rgb(), False, data)
+        self.render_series(inner_surface)
 
-        if self.legend:
+        if self.legend and not self.density:
             self.render_legend(inner_surface)
 
         surface.blit(inner_surface, inner_area.topleft)
 
 
 class App:
-    def __init__(self, df: pl.DataFrame, x_axis="time"):
+    def __init__(
+        self, df: pl.DataFrame, x_axis="time", y_columns=None, cache=None
+    ):
         self.running = True
         self.df = df
         self.x_axis = x_axis
         self.theme_popup = False
 
-        self.view_box = ViewBox(
-            df[self.x_axis].min(),
-            df[self.x_axis].max(),
-            df.select([pl.col(col) for col in df.columns if col != x_axis])
-            .min()
-            .min_horizontal()
-            .item(),
-            df.select([pl.col(col) for col in df.columns if col != x_axis])
-            .max()
-            .max_horizontal()
-            .item(),
-        )
-
-        self.line_plot = LinePlot(df, x_axis=x_axis)
-        self.line_plot.with_view(self.view_box)
+        self.line_plot = LinePlot(df, x_axis=x_axis, y_columns=y_columns, cache=cache)
+        self.view_box = self.line_plot.view_box
 
         self.select = 0
 
@@ -296,6 +557,18 @@ class App:
                         self.select -= 1
                     else:
                         self.view_box.zoom_horizontally(2.0)
+                elif event.text == "d":
+                    self.line_plot.density = not self.line_plot.density
+                elif event.text == "D":
+                    self.line_plot.density_segments = (
+                        not self.line_plot.density_segments
+                    )
+                elif event.text == "e":
+                    from export import export_html
+
+                    path = time.strftime("export-%Y%m%d-%H%M%S.html")
+                    export_html(self.line_plot, path)
+                    print(f"Exported view to {path}")
                 elif event.text == "t":
                     self.theme_popup = not self.theme_popup
                 elif event.text == "q":
@@ -309,14 +582,63 @@ class App:
 
 
 def main():
+    import argparse
     import os
 
+    parser = argparse.ArgumentParser(description="Plot a parquet time series.")
+    parser.add_argument("path", nargs="?", default="data.parquet")
+    parser.add_argument(
+        "--shared",
+        action="store_true",
+        help="map the decoded data from shared memory instead of a private copy",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="where column statistics are kept between launches",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="always recompute column statistics"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="HTML",
+        default=None,
+        help="write the full view to an interactive HTML file and exit",
+    )
+    parser.add_argument(
+        "--export-width",
+        type=int,
+        default=2000,
+        help="pixel width the export is decimated to",
+    )
+    args = parser.parse_args()
+
     os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
-    df = pl.read_parquet("data.parquet")
+    if args.shared:
+        from shared import load_shared
+
+        df = load_shared(args.path)
+    else:
+        df = pl.read_parquet(args.path)
     print("df size mb:", df.estimated_size("mb"))
+    cache = None
+    if not args.no_cache:
+        from cache import AggregateCache
+
+        cache = AggregateCache(args.cache_dir).for_source(args.path)
+    if args.export:
+        from export import export_html
+
+        pygame.init()
+        export_html(LinePlot(df, cache=cache), args.export, width=args.export_width)
+        pygame.quit()
+        print(f"Exported view to {args.export}")
+        return
+
     window = Window(2000, 1000)
     window.init()
-    app = App(df)
+    app = App(df, cache=cache)
     app.run(window)
     window.quit()
 
@@ -0,0 +1,209 @@
+"""Share decoded datasets between viewer processes.
+
+The first process to open a source decodes it once and publishes the columns
+as an uncompressed Arrow IPC file in a shared directory (``/dev/shm`` when it
+exists, so the pages live in POSIX shared memory). Every process, including the
+publisher, then memory-maps that file, so adding a window adds no private copy
+of the data.
+
+Each attached process holds a shared ``flock`` on the file until it exits. The
+last one to leave removes the file, so published frames only occupy memory
+while a viewer uses them. Frames left behind by viewers that crashed are
+removed by ``python shared.py --clean``.
+"""
+
+import argparse
+import atexit
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import polars as pl
+
+from cache import fingerprint
+
+_leases = {}
+_leases_lock = threading.Lock()
+
+
+def default_shared_dir() -> Path:
+    shm = Path("/dev/shm")
+    base = shm if shm.is_dir() else Path(tempfile.gettempdir())
+    return base / "chartdrive"
+
+
+def shared_path(name: str, shared_dir=None) -> Path:
+    return Path(shared_dir or default_shared_dir()) / f"{name}.arrow"
+
+
+def source_prefix(path) -> str:
+    """Prefix shared by every published version of one source file."""
+    source = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    return f"{Path(path).stem}-{source}-"
+
+
+def dataset_name(path) -> str:
+    """Name a source file so that editing it publishes a fresh copy."""
+    return f"{source_prefix(path)}{fingerprint(path)[:16]}"
+
+
+def publish(
+    name: str, df: pl.DataFrame, shared_dir=None, supersedes: str = None
+) -> Path:
+    """Write ``df`` under ``name`` unless another process already has.
+
+    Other frames whose names start with ``supersedes`` are removed, so older
+    versions of a source do not keep holding shared memory."""
+    path = shared_path(name, shared_dir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        try:
+            # A single uncompressed chunk per column is what makes attach()
+            # zero-copy.
+            df.rechunk().write_ipc(tmp, compression="uncompressed")
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+    if supersedes:
+        for stale in path.parent.glob(f"{supersedes}*.arrow"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    return path
+
+
+def attach(name: str, shared_dir=None) -> pl.DataFrame:
+    """Map a published frame; raises ``FileNotFoundError`` if there is none.
+
+    The frame stays published at least until this process calls ``release``
+    or exits."""
+    path = shared_path(name, shared_dir)
+    with _leases_lock:
+        if path not in _leases:
+            fd = os.open(path, os.O_RDONLY)
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            # The last holder may have removed the file while we waited.
+            try:
+                same = os.path.samestat(os.fstat(fd), os.stat(path))
+            except FileNotFoundError:
+                same = False
+            if not same:
+                os.close(fd)
+                raise FileNotFoundError(path)
+            _leases[path] = fd
+    return pl.read_ipc(path, memory_map=True)
+
+
+def attach_or_publish(
+    name: str, build, shared_dir=None, supersedes: str = None
+) -> pl.DataFrame:
+    """Attach to ``name``, publishing the frame returned by ``build()`` first if needed."""
+    try:
+        return attach(name, shared_dir)
+    except FileNotFoundError:
+        publish(name, build(), shared_dir, supersedes)
+    return attach(name, shared_dir)
+
+
+def _remove_if_unused(path: Path, fd: int):
+    """Remove ``path`` if no other process holds a lock on ``fd``'s file."""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    try:
+        if os.path.samestat(os.fstat(fd), os.stat(path)):
+            path.unlink()
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def release(name: str, shared_dir=None):
+    """Stop using a frame, removing it if no other process has it attached."""
+    path = shared_path(name, shared_dir)
+    with _leases_lock:
+        fd = _leases.pop(path, None)
+    if fd is None:
+        return
+    try:
+        _remove_if_unused(path, fd)
+    finally:
+        os.close(fd)
+
+
+def release_all():
+    with _leases_lock:
+        paths = list(_leases)
+    for path in paths:
+        release(path.stem, path.parent)
+
+
+atexit.register(release_all)
+
+
+def clean(shared_dir=None) -> list:
+    """Remove frames and temporary files no running process is using."""
+    removed = []
+    directory = Path(shared_dir or default_shared_dir())
+    if not directory.is_dir():
+        return removed
+    for path in directory.iterdir():
+        if path.name.startswith("."):
+            # Temporary file of a publisher, named ``.<name>.<pid>``.
+            try:
+                os.kill(int(path.name.rsplit(".", 1)[1]), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except (ValueError, IndexError, PermissionError):
+                continue
+            path.unlink(missing_ok=True)
+            removed.append(path)
+        elif path.suffix == ".arrow" and path not in _leases:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                if _remove_if_unused(path, fd):
+                    removed.append(path)
+            finally:
+                os.close(fd)
+    return removed
+
+
+def load_shared(path, shared_dir=None) -> pl.DataFrame:
+    """Read a parquet file through the shared directory."""
+    return attach_or_publish(
+        dataset_name(path),
+        lambda: pl.read_parquet(path),
+        shared_dir,
+        supersedes=source_prefix(path),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage shared datasets.")
+    parser.add_argument("--dir", default=None, help="shared directory")
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="remove frames left behind by viewers that did not exit cleanly",
+    )
+    args = parser.parse_args()
+
+    directory = Path(args.dir or default_shared_dir())
+    if args.clean:
+        for path in clean(directory):
+            print(f"removed {path}")
+        return
+    for path in sorted(directory.glob("*.arrow")):
+        print(f"{path.stat().st_size / 2**20:10.1f} MB  {path.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import polars as pl
+
+from cache import CACHE_VERSION, AggregateCache, fingerprint
+
+
+def test_round_trip(tmp_path):
+    cache = AggregateCache(tmp_path)
+    cache.save("src", ["a"], "stats", {"y": np.array([1.0, 2.0])})
+    loaded = cache.load("src", ["a"], "stats")
+    np.testing.assert_array_equal(loaded["y"], [1.0, 2.0])
+    assert cache.load("src", ["b"], "stats") is None
+
+
+def test_broken_entries_are_misses(tmp_path):
+    cache = AggregateCache(tmp_path)
+    path = cache.path("src", ["a"], "stats")
+    path.parent.mkdir(parents=True)
+    for content in (b"", b"not an archive"):
+        path.write_bytes(content)
+        assert cache.load("src", ["a"], "stats") is None
+        assert not path.exists()
+
+
+def test_eviction_keeps_recent_entries_within_budget(tmp_path):
+    cache = AggregateCache(tmp_path)
+    for i in range(10):
+        cache.save("src", [str(i)], "stats", {"y": np.zeros(100)})
+        os.utime(cache.path("src", [str(i)], "stats"), (i, i))
+    cache.max_bytes = 3000
+    cache.evict()
+    sizes = [p.stat().st_size for p in tmp_path.rglob("*.npz")]
+    assert sum(sizes) <= 3000
+    assert cache.load("src", ["9"], "stats") is not None
+    assert cache.load("src", ["0"], "stats") is None
+
+
+def test_other_versions_are_dropped(tmp_path):
+    stale = tmp_path / f"v{CACHE_VERSION - 1}" / "src" / "stats.npz"
+    stale.parent.mkdir(parents=True)
+    stale.write_bytes(b"old")
+    AggregateCache(tmp_path).save("src", ["a"], "stats", {"y": np.zeros(1)})
+    assert not stale.exists()
+
+
+def test_fingerprint_follows_the_source(tmp_path):
+    path = tmp_path / "data.parquet"
+    pl.DataFrame({"a": [1, 2, 3]}).write_parquet(path)
+    before = fingerprint(path)
+    assert fingerprint(path) == before
+    pl.DataFrame({"a": [1, 2, 4]}).write_parquet(path)
+    assert fingerprint(path) != before
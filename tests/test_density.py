@@ -0,0 +1,56 @@
+import numpy as np
+import polars as pl
+import pygame
+
+from plot import LinePlot, ViewBox, density_counts
+
+
+def test_samples_are_binned_per_pixel():
+    x = np.array([0.5, 0.5, 3.2, 9.9, -1.0, 4.0])
+    y = np.array([1.5, 1.5, 0.0, 4.9, 2.0, 7.0])
+    counts = density_counts(x, [y], 10, 5, segments=False)
+    assert counts.shape == (10, 5)
+    assert counts[0, 1] == 2
+    assert counts[3, 0] == 1
+    assert counts[9, 4] == 1
+    # Samples outside the surface are dropped.
+    assert counts.sum() == 4
+
+
+def test_dense_series_counts_samples_not_series():
+    rng = np.random.default_rng(0)
+    n = 100_000
+    x = np.linspace(0, 100, n, endpoint=False)
+    y = rng.random(n) * 100
+    counts = density_counts(x, [y], 100, 100)
+    # Every segment adds a total of one, spread over the pixels it crosses.
+    assert np.isclose(counts.sum(), n - 1)
+    assert counts.max() > 5
+
+
+def test_segments_connect_sparse_samples():
+    x = np.array([0.0, 999.5, 1999.5])
+    y = np.array([0.0, 999.0, 0.0])
+    counts = density_counts(x, [y], 2000, 1000)
+    assert (counts.sum(axis=1) > 0).all()
+    assert np.isclose(counts.sum(), 2)
+
+
+def test_chunking_does_not_change_counts():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.random(5000)) * 50
+    ys = [rng.random(5000) * 30 for _ in range(3)]
+    whole = density_counts(x, ys, 50, 30)
+    chunked = density_counts(x, ys, 50, 30, chunk=97)
+    assert np.allclose(whole, chunked)
+
+
+def test_density_draws_segments_crossing_the_view():
+    df = pl.DataFrame({"time": [0, 1000], "a": [0.0, 1.0]})
+    plot = LinePlot(df, grid=False, legend=False, density=True)
+    plot.with_view(ViewBox(400, 600, 0.0, 1.0))
+    surface = pygame.Surface((100, 100))
+    surface.fill((0, 0, 0))
+    plot.render_series(surface)
+    drawn = pygame.surfarray.array3d(surface).any(axis=2)
+    assert drawn.any(axis=1).all()
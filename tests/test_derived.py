@@ -0,0 +1,88 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from derived import Derived
+
+PANS = [(1000, 2000), (1500, 2500), (500, 1600), (5000, 6000), (5900, 7100), (0, 300)]
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    return pl.DataFrame(
+        {"a": np.cumsum(rng.normal(size=10_000)), "b": rng.random(10_000) + 1}
+    )
+
+
+def assert_matches_full_frame(df, derived, pans=PANS):
+    full = df.select(derived.expr.alias(derived.name)).to_series()
+    for start, stop in pans:
+        window = derived.evaluate(df, start, stop)
+        expected = full.slice(start, stop - start)
+        assert len(window) == stop - start
+        assert window.is_null().to_list() == expected.is_null().to_list()
+        np.testing.assert_allclose(
+            window.drop_nulls().to_numpy(), expected.drop_nulls().to_numpy()
+        )
+
+
+@pytest.mark.parametrize(
+    "expr, warmup",
+    [
+        (pl.col("a").rolling_mean(50), 49),
+        (pl.col("a").diff(), 1),
+        (pl.col("a").shift(3), 3),
+        (pl.col("a").pct_change(5), 5),
+        (pl.col("a") / pl.col("b"), 0),
+    ],
+)
+def test_windowed_matches_full_frame(df, expr, warmup):
+    assert_matches_full_frame(df, Derived(expr.alias("d"), warmup=warmup))
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        pl.col("a").cum_sum(),
+        pl.col("a").ewm_mean(alpha=0.1),
+        pl.col("a") - pl.col("a").mean(),
+        pl.col("a").shift(-1),
+    ],
+)
+def test_without_warmup_matches_full_frame(df, expr):
+    assert_matches_full_frame(df, Derived(expr.alias("d")))
+
+
+def test_cache_is_trimmed_around_the_window(df):
+    derived = Derived(pl.col("a").diff().alias("d"), warmup=1)
+    for start in range(0, 9000, 500):
+        derived.evaluate(df, start, start + 1000)
+    assert len(derived._values) <= 3000
+
+
+def test_new_frame_invalidates_cache(df):
+    derived = Derived((pl.col("a") * 2).alias("d"), warmup=0)
+    derived.evaluate(df, 0, 100)
+    other = df.with_columns(pl.col("a") + 1)
+    expected = other.select(pl.col("a") * 2).to_series().slice(0, 100)
+    assert derived.evaluate(other, 0, 100).to_list() == expected.to_list()
+
+
+def test_negative_warmup_is_rejected():
+    with pytest.raises(ValueError):
+        Derived(pl.col("a").diff(), warmup=-1)
+
+
+def test_line_plot_evaluates_only_visible_rows(df):
+    from plot import LinePlot, ViewBox
+
+    frame = df.with_columns(pl.Series("time", np.arange(df.height) * 10))
+    rm = Derived(pl.col("a").rolling_mean(20).alias("rm"), warmup=19)
+    plot = LinePlot(frame, y_columns=["a", rm])
+    expected = frame.with_columns(pl.col("a").rolling_mean(20).alias("rm"))
+    for left, right in [(20_000, 30_000), (25_000, 35_000), (90_000, 99_990)]:
+        plot.with_view(ViewBox(left, right, 0, 1))
+        visible = plot.visible_frame()
+        want = expected.filter(pl.col("time").is_between(left, right))
+        np.testing.assert_allclose(visible["rm"].to_numpy(), want["rm"].to_numpy())
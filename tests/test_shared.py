@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+import shared
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def frame():
+    return pl.DataFrame({"time": [1, 2, 3], "value": [1.0, 4.0, 9.0]})
+
+
+def test_last_release_removes_frame(tmp_path):
+    df = shared.attach_or_publish("data", frame, tmp_path)
+    assert df.equals(frame())
+    path = shared.shared_path("data", tmp_path)
+    assert path.exists()
+    shared.release("data", tmp_path)
+    assert not path.exists()
+
+
+def test_frame_kept_while_another_process_is_attached(tmp_path):
+    shared.attach_or_publish("data", frame, tmp_path)
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            textwrap.dedent(
+                f"""
+                import sys
+                import shared
+                shared.attach("data", {str(tmp_path)!r})
+                print("attached", flush=True)
+                sys.stdin.read()
+                """
+            ),
+        ],
+        cwd=ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "attached"
+        shared.release("data", tmp_path)
+        path = shared.shared_path("data", tmp_path)
+        assert path.exists()
+        assert shared.clean(tmp_path) == []
+    finally:
+        holder.communicate("")
+    # The other process released the frame on exit.
+    assert not path.exists()
+
+
+def test_attach_missing_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        shared.attach("missing", tmp_path)
+
+
+def test_clean_removes_unused_frames_and_orphaned_temp_files(tmp_path):
+    shared.publish("orphan", frame(), tmp_path)
+    dead = subprocess.run(
+        [sys.executable, "-c", "import os; print(os.getpid())"],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    orphan_tmp = tmp_path / f".orphan.arrow.{dead}"
+    orphan_tmp.write_bytes(b"partial")
+    live_tmp = tmp_path / ".other.arrow.1"
+    live_tmp.write_bytes(b"partial")
+
+    removed = shared.clean(tmp_path)
+
+    assert sorted(removed) == sorted(
+        [shared.shared_path("orphan", tmp_path), orphan_tmp]
+    )
+    assert live_tmp.exists()
+
+
+def test_publish_supersedes_older_versions(tmp_path):
+    shared.publish("source-abc-old", frame(), tmp_path)
+    shared.publish("source-abc-new", frame(), tmp_path, supersedes="source-abc-")
+    assert [p.name for p in tmp_path.glob("*.arrow")] == ["source-abc-new.arrow"]
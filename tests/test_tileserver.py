@@ -0,0 +1,154 @@
+import io
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+import numpy as np
+import polars as pl
+import pygame
+import pytest
+
+from theme import themes
+from tileserver import TileCache, TileRenderer, serve
+
+THEME = "onehalfdark"
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 10_000
+    return pl.DataFrame(
+        {
+            "time": np.arange(n) * 60_000_000,
+            "a": np.cumsum(rng.normal(size=n)),
+            "b c": np.cumsum(rng.normal(size=n)),
+        }
+    )
+
+
+@pytest.fixture
+def renderer(df, tmp_path):
+    renderer = TileRenderer(df, cache=TileCache(tmp_path), dataset="ds", workers=4)
+    yield renderer
+    renderer.shutdown()
+
+
+@pytest.fixture
+def base_url(renderer):
+    server = serve(renderer, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.status, response.headers, response.read()
+
+
+def status(url):
+    try:
+        return get(url)[0]
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def drawn_columns(png):
+    pixels = pygame.surfarray.array3d(pygame.image.load(io.BytesIO(png)))
+    background = np.array(themes[THEME].bg1.rgb())
+    return (pixels != background).any(axis=2).any(axis=1)
+
+
+def test_index_page_points_at_the_dataset(base_url):
+    code, headers, body = get(base_url + "/")
+    assert code == 200
+    assert headers["Cache-Control"] == "no-cache"
+    assert b'"ds"' in body
+
+
+def test_tile_is_png_and_cacheable(base_url):
+    code, headers, body = get(f"{base_url}/tile/ds/{THEME}/a/0/0.png")
+    assert code == 200
+    assert headers["Content-Type"] == "image/png"
+    assert "immutable" in headers["Cache-Control"]
+    assert pygame.image.load(io.BytesIO(body)).get_size() == (256, 256)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        f"/tile/other/{THEME}/a/0/0.png",
+        "/tile/ds/nosuchtheme/a/0/0.png",
+        f"/tile/ds/{THEME}/nosuchcolumn/0/0.png",
+        f"/tile/ds/{THEME}/a/1/2.png",
+        f"/tile/ds/{THEME}/a/0/x.png",
+        "/nothing",
+    ],
+)
+def test_bad_addresses_are_404(base_url, path):
+    assert status(base_url + path) == 404
+
+
+def test_escaped_column_names_are_served(base_url):
+    assert status(f"{base_url}/tile/ds/{THEME}/a,{quote('b c')}/0/0.png") == 200
+
+
+def test_render_errors_are_500(base_url, renderer):
+    def fail(key):
+        raise RuntimeError("boom")
+
+    renderer.render = fail
+    assert status(f"{base_url}/tile/ds/{THEME}/a/3/3.png") == 500
+
+
+@pytest.mark.parametrize("zoom", [9, 14, 20])
+def test_tiles_join_at_their_edges(renderer, zoom):
+    for x in np.random.default_rng(zoom).integers(0, 2**zoom, 10):
+        columns = drawn_columns(renderer.tile((THEME, ("a",), zoom, int(x))))
+        assert columns[0] and columns[-1]
+
+
+def test_repeated_tiles_render_once(renderer, tmp_path):
+    calls = []
+    render = renderer.render
+    renderer.render = lambda key: calls.append(key) or render(key)
+    key = (THEME, ("a",), 2, 1)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(renderer.tile(key)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [key]
+    assert len(set(results)) == 1
+
+    # A new renderer over the same directory is served from disk.
+    fresh = TileRenderer(renderer.df, cache=TileCache(tmp_path), dataset="ds")
+    fresh.render = lambda key: pytest.fail("tile should come from disk")
+    assert fresh.tile(key) == results[0]
+    fresh.shutdown()
+
+
+def test_serving_a_tile_prefetches_its_neighbours(base_url, renderer):
+    get(f"{base_url}/tile/ds/{THEME}/a/3/4.png")
+    neighbours = [(THEME, ("a",), 3, x) for x in (3, 5)]
+    deadline = time.monotonic() + 10
+    while any(renderer.cache.get(key) is None for key in neighbours):
+        assert time.monotonic() < deadline, "neighbours were not prefetched"
+        time.sleep(0.01)
+
+
+def test_disk_cache_stays_within_budget(df, tmp_path):
+    renderer = TileRenderer(df, cache=TileCache(tmp_path, max_disk_bytes=20_000))
+    for x in range(16):
+        renderer.tile((THEME, ("a",), 4, x))
+    renderer.shutdown()
+    assert sum(p.stat().st_size for p in tmp_path.rglob("*.png")) <= 20_000
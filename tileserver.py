@@ -0,0 +1,414 @@
+"""Serve PNG tiles of a LinePlot over local HTTP.
+
+Tiles are addressed as ``/tile/<dataset>/<theme>/<col,col,...>/<zoom>/<x>.png``.
+At zoom level ``z`` the full x extent of the dataset is split into ``2**z`` tiles
+of ``TILE_SIZE`` pixels square. The y extent is fixed per column set so that
+neighbouring tiles line up. The dataset id changes whenever the source does, so
+browsers may cache tiles indefinitely.
+"""
+
+import argparse
+import copy
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+import polars as pl  # noqa: E402
+
+from cache import AggregateCache  # noqa: E402
+from plot import LinePlot, ViewBox  # noqa: E402
+from shared import source_prefix  # noqa: E402
+from theme import themes  # noqa: E402
+
+TILE_SIZE = 256
+MAX_ZOOM = 20
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+
+class TileCache:
+    """In-memory LRU of encoded tiles, backed by a size-bounded directory of PNG
+    files from which the least recently used are evicted."""
+
+    def __init__(
+        self,
+        cache_dir=None,
+        capacity: int = 1024,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.capacity = capacity
+        self.max_disk_bytes = max_disk_bytes
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.cache_dir is not None and self.cache_dir.is_dir():
+            self._disk_bytes = sum(f.stat().st_size for f in self._disk_files())
+
+    def path(self, key) -> Path:
+        theme_name, columns, zoom, x = key
+        columns_id = hashlib.sha1(",".join(columns).encode()).hexdigest()[:16]
+        return self.cache_dir / theme_name / columns_id / str(zoom) / f"{x}.png"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        if self.cache_dir is None:
+            return None
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+            # Refresh the mtime so eviction treats it as recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data: bytes):
+        self._remember(key, data)
+        if self.cache_dir is None:
+            return
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        with self._disk_lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _disk_files(self):
+        return self.cache_dir.rglob("*.png")
+
+    def _evict(self):
+        """Delete the least recently used tiles down to 90% of the budget."""
+        entries = []
+        for path in self._disk_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._disk_bytes = total
+
+    def _remember(self, key, data: bytes):
+        with self._lock:
+            self._tiles[key] = data
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.capacity:
+                self._tiles.popitem(last=False)
+
+
+class TileRenderer:
+    """Render tiles offscreen on a worker pool, deduplicating in-flight work."""
+
+    def __init__(
+        self,
+        df: pl.DataFrame,
+        x_axis="time",
+        tile_size: int = TILE_SIZE,
+        cache: TileCache = None,
+        workers: int = None,
+        stats_cache=None,
+        dataset: str = None,
+    ):
+        """``dataset`` names the source in tile URLs; without one a fresh id is
+        used per process so browsers never reuse tiles of another dataset."""
+        pygame.init()
+        self.df = df
+        self.dataset = dataset or uuid.uuid4().hex[:16]
+        self.x_axis = x_axis
+        self.tile_size = tile_size
+        self.cache = cache or TileCache()
+        self.stats_cache = stats_cache
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._plots = {}
+        self._plot_locks = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def columns(self):
+        return [col for col in self.df.columns if col != self.x_axis]
+
+    def plot_for(self, columns: tuple) -> LinePlot:
+        # Building a plot scans the frame, so only requests for the same column
+        # set wait on it.
+        with self._lock:
+            plot = self._plots.get(columns)
+            if plot is not None:
+                return plot
+            build_lock = self._plot_locks.setdefault(columns, threading.Lock())
+        with build_lock:
+            with self._lock:
+                plot = self._plots.get(columns)
+            if plot is None:
+                plot = LinePlot(
+                    self.df,
+                    x_axis=self.x_axis,
+                    y_columns=list(columns),
+                    grid=False,
+                    legend=False,
+                    cache=self.stats_cache,
+                )
+                with self._lock:
+                    self._plots[columns] = plot
+            return plot
+
+    def validate(self, key):
+        """Raise ``KeyError`` if the tile address does not exist."""
+        theme_name, columns, zoom, x = key
+        if theme_name not in themes:
+            raise KeyError(f"unknown theme {theme_name!r}")
+        unknown = set(columns) - set(self.columns())
+        if not columns or unknown:
+            raise KeyError(f"unknown columns {sorted(unknown)}")
+        if not 0 <= zoom <= MAX_ZOOM or not 0 <= x < 2**zoom:
+            raise KeyError(f"tile {zoom}/{x} out of range")
+
+    def tile(self, key) -> bytes:
+        """Return the encoded tile, rendering it if it is not cached."""
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        return self.submit(key).result()
+
+    def submit(self, key) -> Future:
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(self._render_and_store, key)
+                self._pending[key] = future
+            return future
+
+    def prefetch(self, keys):
+        """Queue rendering of any of ``keys`` that are not cached yet."""
+        for key in keys:
+            if self.cache.get(key) is None:
+                self.submit(key)
+
+    def neighbours(self, key):
+        """The tiles either side of ``key``, which a pan shows next."""
+        theme_name, columns, zoom, x = key
+        return [
+            (theme_name, columns, zoom, n) for n in (x - 1, x + 1) if 0 <= n < 2**zoom
+        ]
+
+    def _render_and_store(self, key) -> bytes:
+        try:
+            data = self.render(key)
+            self.cache.put(key, data)
+            return data
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def render(self, key) -> bytes:
+        theme_name, columns, zoom, x = key
+        theme = themes[theme_name]
+        base = self.plot_for(columns)
+        full = base.view_box
+        span = full.width() / 2**zoom
+        left = full.left + x * span
+        plot = (
+            copy.copy(base)
+            .with_view(ViewBox(left, left + span, full.bottom, full.top))
+            .with_theme(theme)
+        )
+
+        surface = pygame.Surface((self.tile_size, self.tile_size))
+        surface.fill(theme.bg1.rgb())
+        plot.render_series(surface)
+
+        buffer = io.BytesIO()
+        pygame.image.save(surface, buffer, "tile.png")
+        return buffer.getvalue()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+INDEX_HTML = """<!doctype html>
+<html>
+<head>
+<title>chartdrive</title>
+<style>
+body {{ margin: 0; background: #000; overflow: hidden; }}
+#tiles {{ position: absolute; top: 0; left: 0; white-space: nowrap; }}
+#tiles img {{ width: {size}px; height: {size}px; }}
+</style>
+</head>
+<body>
+<div id="tiles"></div>
+<script>
+const params = new URLSearchParams(location.search);
+const dataset = encodeURIComponent({dataset});
+const theme = encodeURIComponent(params.get("theme") || {theme});
+const cols = (params.get("cols") || {cols})
+  .split(",").map(encodeURIComponent).join(",");
+let zoom = 0, offset = 0;  // offset is in tiles at the current zoom
+function draw() {{
+  const count = Math.ceil(innerWidth / {size}) + 1;
+  const first = Math.floor(offset);
+  const tiles = document.getElementById("tiles");
+  tiles.replaceChildren();
+  tiles.style.left = -Math.round((offset - first) * {size}) + "px";
+  for (let x = first; x < first + count; x++) {{
+    const img = document.createElement("img");
+    if (x >= 0 && x < 2 ** zoom)
+      img.src = `/tile/${{dataset}}/${{theme}}/${{cols}}/${{zoom}}/${{x}}.png`;
+    tiles.appendChild(img);
+  }}
+}}
+addEventListener("keydown", (e) => {{
+  const visible = innerWidth / {size};
+  if (e.key === "h") offset -= visible / 2;
+  if (e.key === "l") offset += visible / 2;
+  if (e.key === "j" && zoom < {max_zoom}) {{ zoom++; offset = offset * 2 + visible / 2; }}
+  if (e.key === "k" && zoom > 0) {{ zoom--; offset = (offset - visible / 2) / 2; }}
+  draw();
+}});
+addEventListener("resize", draw);
+draw();
+</script>
+</body>
+</html>
+"""
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        renderer: TileRenderer = self.server.renderer
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if parts == [""]:
+            page = INDEX_HTML.format(
+                size=renderer.tile_size,
+                dataset=json.dumps(renderer.dataset),
+                theme=json.dumps(next(iter(themes))),
+                cols=json.dumps(",".join(renderer.columns())),
+                max_zoom=MAX_ZOOM,
+            )
+            self.respond(200, "text/html; charset=utf-8", page.encode(), "no-cache")
+            return
+        try:
+            if (
+                len(parts) != 6
+                or parts[0] != "tile"
+                or unquote(parts[1]) != renderer.dataset
+                or not parts[5].endswith(".png")
+            ):
+                raise KeyError(self.path)
+            # Columns are split before unquoting so names may contain commas.
+            key = (
+                unquote(parts[2]),
+                tuple(unquote(col) for col in parts[3].split(",")),
+                int(unquote(parts[4])),
+                int(unquote(parts[5]).removesuffix(".png")),
+            )
+            renderer.validate(key)
+        except (KeyError, ValueError):
+            self.send_error(404)
+            return
+        try:
+            data = renderer.tile(key)
+        except Exception:
+            traceback.print_exc()
+            self.send_error(500)
+            return
+        self.respond(200, "image/png", data, "max-age=31536000, immutable")
+        renderer.prefetch(renderer.neighbours(key))
+
+    def respond(
+        self, status: int, content_type: str, body: bytes, cache_control: str
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(renderer: TileRenderer, host="127.0.0.1", port=8000) -> ThreadingHTTPServer:
+    """Create a tile server bound to ``host:port``; call ``serve_forever`` on it."""
+    server = ThreadingHTTPServer((host, port), TileRequestHandler)
+    server.daemon_threads = True
+    server.renderer = renderer
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve plot tiles over HTTP.")
+    parser.add_argument("path", nargs="?", default="data.parquet")
+    parser.add_argument("--x-axis", default="time")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-dir", default=".tiles")
+    parser.add_argument(
+        "--max-cache-mb", type=int, default=DEFAULT_MAX_DISK_BYTES // 2**20
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    # Key the on-disk tiles by the source file so edits never serve stale tiles.
+    stats_cache = AggregateCache().for_source(args.path)
+    prefix = source_prefix(args.path)
+    dataset_id = f"{prefix}{stats_cache.source[:16]}"
+    cache_dir = Path(args.cache_dir)
+    for stale in cache_dir.iterdir() if cache_dir.is_dir() else ():
+        if stale.name.startswith(prefix) and stale.name != dataset_id:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    df = pl.read_parquet(args.path)
+    renderer = TileRenderer(
+        df,
+        x_axis=args.x_axis,
+        cache=TileCache(
+            cache_dir / dataset_id, max_disk_bytes=args.max_cache_mb * 2**20
+        ),
+        workers=args.workers,
+        stats_cache=stats_cache,
+        dataset=dataset_id,
+    )
+    server = serve(renderer, args.host, args.port)
+    print(f"Serving tiles on http://{args.host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        renderer.shutdown()
+
+
+if __name__ == "__main__":
+    main()